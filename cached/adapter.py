@@ -1,12 +1,19 @@
+from datetime import timezone
+from email.utils import parsedate_to_datetime
 from pathlib import Path
+from typing import Optional, Union
 
 import logging
+import sys
+import time
 import requests
 from requests.structures import CaseInsensitiveDict
 from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-from .cache import Cache, HttpAwareCache, FileCache
-from .model import Request, Response
+from .cache import Cache, HttpAwareCache, FileCache, MemoryCache
+from .model import CacheEntry, Request, Response
+from .util import case_insensitive
 
 
 logger = logging.getLogger(__name__)
@@ -45,27 +52,23 @@ class CachedHTTPAdapter(HTTPAdapter):
         #   b. Pipe response body to a file as it is read. Must be sure it is
         #      all consumed, otherwise the cache entry will be invalid.
 
+        # The headers are used as-is rather than copied; `requests` already keeps them in a case-insensitive mapping.
+        # The URI is interned as it is used as a key by the caches, which can then compare repeated URIs by identity.
         request = Request(method=requests_request.method,
-                          uri=requests_request.url,
-                          headers=dict(requests_request.headers))
+                          uri=sys.intern(requests_request.url),
+                          headers=requests_request.headers)
 
         logger.info('Attempting to find a matching cache entry.')
         entry = self.cache.get(request)
         if entry is None:
             logger.info('No matching cache entry found.')
             # No valid cached entry. Need to make the request.
-            requests_response = super().send(requests_request, **kw)
-            response = Response(status=requests_response.status_code,
-                                reason=requests_response.reason,
-                                headers=dict(requests_response.headers),
-                                body=requests_response.raw)
-            entry = self.cache.add(request, response)
-            response = entry.response
+            response = self._cache(request, self._send(requests_request, **kw))
+        elif _is_stale(entry, time.time()):
+            logger.info('Found a matching cache entry, but it is stale. Revalidating it.')
+            response = self._revalidate(requests_request, request, entry, **kw)
         else:
             logger.info('Found a matching cache entry. Using the cached response')
-            # TODO Check if stale. If so, need to make the request with `If-None-Match: response.headers['etag']`,
-            # checking for `HTTP 304 Not Modified`.
-            # Staleness should be checked against either the time of response or request. Not sure.
             response = entry.response
 
         logger.info('Converting the response to a requests.Response object.')
@@ -73,6 +76,7 @@ class CachedHTTPAdapter(HTTPAdapter):
         result = requests.Response()
         result.status_code = response.status
         result.reason = response.reason
+        # Always copy, since the cached headers are shared with every other hit on the same entry.
         result.headers = CaseInsensitiveDict(response.headers)
         # TODO I think if stream=True is provided, we set raw. Otherwise, we should read body and set content?
         result.raw = response.body
@@ -82,6 +86,47 @@ class CachedHTTPAdapter(HTTPAdapter):
         logger.info('Returning the response.')
         return result
 
+    def _send(self, requests_request: requests.PreparedRequest, **kw) -> Response:
+        requests_response = super().send(requests_request, **kw)
+        return Response(status=requests_response.status_code,
+                        reason=requests_response.reason,
+                        headers=requests_response.headers,
+                        body=requests_response.raw)
+
+    def _cache(self, request: Request, response: Response) -> Response:
+        entry = self.cache.add(request, response)
+        if entry is None:
+            logger.info('The response could not be cached.')
+            return response
+        return entry.response
+
+    def _revalidate(self, requests_request: requests.PreparedRequest, request: Request, entry: CacheEntry,
+                    **kw) -> Response:
+        """
+        Send a conditional request for a stale cache entry, reusing the cached response if it is still valid.
+        """
+        headers = case_insensitive(entry.response.headers)
+        conditional_request = requests_request.copy()
+        if 'ETag' in headers:
+            conditional_request.headers['If-None-Match'] = headers['ETag']
+        if 'Last-Modified' in headers:
+            conditional_request.headers['If-Modified-Since'] = headers['Last-Modified']
+
+        response = self._send(conditional_request, **kw)
+        if response.status == 304:
+            logger.info('The cached response is still valid. Using the cached response.')
+            _release(response.body)
+            self.cache.touch(request)
+            return entry.response
+
+        logger.info('The cached response is no longer valid. Replacing it.')
+        entry.response.body.close()
+        new_entry = self.cache.replace(request, response)
+        if new_entry is None:
+            logger.info('The response could not be cached.')
+            return response
+        return new_entry.response
+
     def close(self):
         logger.info('Closing the cache')
         self.cache.close()
@@ -89,6 +134,102 @@ class CachedHTTPAdapter(HTTPAdapter):
         super().close()
 
 
-def create(directory: Path) -> CachedHTTPAdapter:
-    logger.info('Creating a new HTTPAdapter that caches into {}'.format(directory))
-    return CachedHTTPAdapter(HttpAwareCache(FileCache(directory, 5)))
+def _release(body) -> None:
+    """
+    Finish with a response body that is not needed, such as that of a 304, keeping its connection open for reuse.
+
+    Closing the body would drop the connection. Reading it to the end lets it go back to the pool, as `requests` does.
+    """
+    body.read()
+    release_conn = getattr(body, 'release_conn', None)
+    if release_conn is not None:
+        release_conn()
+
+
+def _freshness_lifetime(headers: CaseInsensitiveDict, fetched_at: float) -> Optional[float]:
+    """
+    Determine how long a response stays fresh, in seconds, from its Cache-Control or Expires headers.
+
+    @param headers
+      The headers of the response.
+    @param fetched_at
+      When the response was received, in seconds since the epoch. Expires is measured from this if the response has no
+      Date header.
+    @return
+      The freshness lifetime, or `None` if the response does not specify one.
+    """
+    directives = [directive.strip().lower() for directive in headers.get('Cache-Control', '').split(',')]
+    if 'no-cache' in directives:
+        return 0
+    for directive in directives:
+        if directive.startswith('max-age='):
+            try:
+                return max(0, int(directive[len('max-age='):]))
+            except ValueError:
+                # Per RFC 7234 section 4.2.1, an invalid max-age means the response is stale.
+                return 0
+
+    if 'Expires' in headers:
+        try:
+            expires = _parse_http_date(headers['Expires'])
+            date = _parse_http_date(headers['Date']) if 'Date' in headers else fetched_at
+        except (TypeError, ValueError):
+            # Per RFC 7234 section 5.3, an invalid Expires date means the response is stale.
+            return 0
+        return max(0, expires - date)
+
+    return None
+
+
+def _parse_http_date(value: str) -> float:
+    """
+    Parse an HTTP date into seconds since the epoch.
+
+    @throws TypeError, ValueError
+      If `value` is not a valid date.
+    """
+    date = parsedate_to_datetime(value)
+    if date.tzinfo is None:
+        # A zone of -0000 yields a naive datetime. HTTP dates are always in UTC.
+        date = date.replace(tzinfo=timezone.utc)
+    return date.timestamp()
+
+
+def _is_stale(entry: CacheEntry, now: float) -> bool:
+    """
+    Check whether a cache entry is no longer fresh and needs to be revalidated.
+
+    Entries without an explicit freshness lifetime are never considered stale.
+    """
+    if entry.fetched_at is None:
+        return False
+    lifetime = _freshness_lifetime(case_insensitive(entry.response.headers), entry.fetched_at)
+    if lifetime is None:
+        return False
+    return now - entry.fetched_at >= lifetime
+
+
+def create(directory: Path,
+           pool_connections: int = 20,
+           pool_maxsize: int = 100,
+           max_retries: Union[int, Retry] = 0) -> CachedHTTPAdapter:
+    """
+    Create an adapter that caches responses into `directory`.
+
+    The pool sizes are larger than `requests`' defaults so that cache misses can reuse established connections rather
+    than paying for a new TCP and TLS handshake each time.
+
+    @param directory
+      The root directory of the cache.
+    @param pool_connections
+      The number of hosts to keep connection pools for.
+    @param pool_maxsize
+      The maximum number of connections to keep in each pool.
+    @param max_retries
+      How to retry failed requests. Passed through to `HTTPAdapter`.
+    """
+    logger.info('Creating a new HTTPAdapter that caches into %s', directory)
+    return CachedHTTPAdapter(HttpAwareCache(MemoryCache(FileCache(directory, 5))),
+                             pool_connections=pool_connections,
+                             pool_maxsize=pool_maxsize,
+                             max_retries=max_retries)
@@ -1,20 +1,67 @@
 from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 from copy import copy
 from dataclasses import dataclass
+import errno
+import functools
 import hashlib
-import json
+from io import BytesIO
 import logging
 import os
 from pathlib import Path
-import shutil
+import struct
 import tempfile
-from typing import Mapping, Optional
-from .util import clamp, Tee
+import threading
+import time
+from typing import Callable, io, Mapping, Optional, Set, Tuple
+from requests.structures import CaseInsensitiveDict
+from .util import case_insensitive, clamp, FileBody, json_dumps, json_loads, MappedBody, Tee, ThreadedWriter
 from .model import CacheEntry, Request, Response
 
 
 logger = logging.getLogger(__name__)
 
+MMAP_THRESHOLD = 64 * 1024
+"""
+Response bodies of at least this many bytes are memory mapped rather than read through a buffer.
+"""
+
+WRITE_BUFFER_SIZE = 1024 * 1024
+"""
+Size of the buffer used when writing new cache entries, so that small reads of the response body do not each cost a
+system call.
+"""
+
+
+def _hash_uri(uri: str) -> str:
+    # SHA-256 is kept so that the on-disk layout is stable regardless of which optional packages are installed. OpenSSL
+    # uses the SHA extensions where the CPU has them, so the digest itself is cheap.
+    return hashlib.sha256(uri.encode('utf-8')).hexdigest()
+
+
+def _split_path(path: str, levels: int) -> str:
+    # TODO Ensure that `path` is at least `levels` long.
+    # Paths within the cache are plain strings. `Path` objects cost a lot more to build and join, and everything in `os`
+    # accepts strings directly.
+    return os.sep.join((*path[:levels], path[levels:]))
+
+
+@functools.lru_cache(maxsize=2048)
+def _uri_path(uri: str, levels: int) -> str:
+    # A single send() looks the same URI up several times (`get()`, then `add()` or `delete()`), so remember the hashed
+    # and split path rather than rebuilding it each time.
+    return _split_path(_hash_uri(uri), levels)
+
+
+_MISSING = object()
+
+
+@functools.lru_cache(maxsize=256)
+def _parse_vary(value: str) -> Tuple[str, ...]:
+    # Servers tend to send the same few Vary values over and over, so remember how each one splits.
+    return tuple(key.strip() for key in value.split(',') if key.strip())
+
 
 class Cache(ABC):
     """
@@ -68,6 +115,33 @@ class Cache(ABC):
         @todo I may be that we really should delete based on URI or something like that.
         """
 
+    def replace(self, request: Request, response: Response) -> Optional[CacheEntry]:
+        """
+        Replace any cached response for `request` with `response`.
+
+        By default this simply `delete()`s and then `add()`s. Implementations may do better, e.g., by avoiding a window
+        in which there is no cached response at all.
+
+        @param request
+          The request for which a response should be cached.
+        @param response
+          The response to cache.
+        @return
+          A cached entry, or `None` if the cache could not cache the response.
+        """
+        self.delete(request)
+        return self.add(request, response)
+
+    def touch(self, request: Request) -> None:
+        """
+        Record that the cached response for `request` has just been revalidated.
+
+        This resets the `fetched_at` time of the entry. Caches that do not track that time need not do anything.
+
+        @param request
+          A request to find in the cache.
+        """
+
     def close(self):
         """
         Close any resources associated with the cache.
@@ -84,6 +158,10 @@ class HttpAwareCache(Cache):
     - Respecting the Cache-Control header such as no-cache, max-age, etc. (Will require expanding the entry structure).
     """
 
+    cachable_status_codes = frozenset((200, 203, 300, 301))
+    # TODO We could cache HEAD as well, even return a HEAD based on a GET.
+    cachable_methods = frozenset(('GET',))
+
     def __init__(self, implementation: Cache) -> None:
         self.__impl = implementation
 
@@ -95,31 +173,42 @@ class HttpAwareCache(Cache):
             return None
 
         # region Only cache for response statuses that make sense to cache.
-        if not self._is_cachable_status_code(entry.response.status):
-            logger.info('Status code {} is not cachable'.format(entry.response.status))
+        # The membership tests are inlined here as they run on every lookup.
+        if entry.response.status not in self.cachable_status_codes:
+            logger.info('Status code %s is not cachable', entry.response.status)
             return None
-        if not self._is_cachable_method(entry.request.method):
-            logger.info('Method {} is not cachable'.format(entry.request.method))
+        if entry.request.method not in self.cachable_methods:
+            logger.info('Method %s is not cachable', entry.request.method)
             return None
         # endregion
 
         # region Only cache if all specific Vary headers match.
-        vary_header_keys = entry.response.headers.get('Vary', []).split(',')
-        for key in vary_header_keys:
-            if key not in entry.request.headers:
-                logger.warning('The cache entry does not have all of its own Vary headers. Missing header: {}'.format(key))
-                return None
-            expected_value = entry.request.headers[key]
-
-            if key not in request.headers:
-                logger.info('Cache entry is rejected because the incoming request is missing a Vary header: {}'.format(key))
-                return None
-            value = request.headers[key]
-
-            if expected_value != value:
-                # Doesn't match as the vary header doesn't have the same value.
-                logger.info('Cache entry is rejected because the value for a Vary header is not equal to the value in the original request. Header: {}. Expected value: {}. Actual value: {}'.format(key, expected_value, value))
-                return None
+        vary_header_keys = _parse_vary(entry.response.headers.get('Vary', ''))
+        if vary_header_keys:
+            # Vary may name headers in a different case than the requests do.
+            expected_headers = case_insensitive(entry.request.headers)
+            headers = case_insensitive(request.headers)
+            expected_values = tuple(expected_headers.get(key, _MISSING) for key in vary_header_keys)
+            values = tuple(headers.get(key, _MISSING) for key in vary_header_keys)
+        else:
+            expected_values = values = ()
+        # Compare all the values at once in the common case where they match, and only go through them one by one to
+        # explain a mismatch.
+        if expected_values != values or _MISSING in expected_values:
+            for key, expected_value, value in zip(vary_header_keys, expected_values, values):
+                if expected_value is _MISSING:
+                    logger.warning('The cache entry does not have all of its own Vary headers. Missing header: %s', key)
+                    return None
+                if value is _MISSING:
+                    logger.debug('Cache entry is rejected because the incoming request is missing a Vary header: %s',
+                                 key)
+                    return None
+                if expected_value != value:
+                    # Doesn't match as the vary header doesn't have the same value.
+                    logger.debug('Cache entry is rejected because the value for a Vary header is not equal to the '
+                                 'value in the original request. Header: %s. Expected value: %s. Actual value: %s',
+                                 key, expected_value, value)
+                    return None
         # endregion
 
         # region Only cache if the Cache-Control predicate is satisfied.
@@ -131,11 +220,7 @@ class HttpAwareCache(Cache):
         return entry
 
     def add(self, request: Request, response: Response) -> Optional[CacheEntry]:
-        if not self._is_cachable_status_code(response.status):
-            logger.info('Refusing to create cache entry. Status code {} is not cachable.'.format(response.status))
-            return None
-        if not self._is_cachable_method(request.method):
-            logger.info('Refusing to create cache entry. Method {} is not cachable.'.format(request.method))
+        if not self._is_cachable(request, response):
             return None
 
         logger.info('Delegating cache entry creation to decorated cache.')
@@ -145,12 +230,128 @@ class HttpAwareCache(Cache):
         logger.info('Delegating cache entry deletion to decorated cache.')
         self.__impl.delete(request)
 
-    def _is_cachable_status_code(self, status: int) -> bool:
-        return status in (200, 203, 300, 301,)
+    def replace(self, request: Request, response: Response) -> Optional[CacheEntry]:
+        if not self._is_cachable(request, response):
+            # The old response is no longer valid, even if the new one cannot be cached.
+            self.__impl.delete(request)
+            return None
+
+        logger.info('Delegating cache entry replacement to decorated cache.')
+        return self.__impl.replace(request, response)
+
+    def _is_cachable(self, request: Request, response: Response) -> bool:
+        if response.status not in self.cachable_status_codes:
+            logger.info('Refusing to create cache entry. Status code %s is not cachable.', response.status)
+            return False
+        if request.method not in self.cachable_methods:
+            logger.info('Refusing to create cache entry. Method %s is not cachable.', request.method)
+            return False
+        return True
 
-    def _is_cachable_method(self, method: str) -> bool:
-        # TODO We could cache HEAD as well, even return a HEAD based on a GET.
-        return method in {'GET'}
+    def touch(self, request: Request) -> None:
+        self.__impl.touch(request)
+
+    def close(self):
+        self.__impl.close()
+
+
+class MemoryCache(Cache):
+    """
+    Keeps recently used cache entries in memory, in front of another cache.
+
+    Only entries with small bodies are kept, since the whole body must be held in memory. Lookups for anything else are
+    passed through to the decorated cache. Entries are keyed on the request URI, as the decorated cache is expected to
+    be.
+
+    Note that this only sees changes made through itself. If other processes modify the decorated cache, entries held
+    here may be stale.
+    """
+
+    def __init__(self, implementation: Cache, max_entries: int = 256, max_body_size: int = 64 * 1024) -> None:
+        """
+        Initialize the memory cache.
+
+        @param implementation
+          The cache to decorate.
+        @param max_entries
+          The number of entries to hold in memory. The least recently used entry is evicted first.
+        @param max_body_size
+          The size, in bytes, of the largest response body to hold in memory.
+        """
+        self.__impl = implementation
+        self.__max_entries = max_entries
+        self.__max_body_size = max_body_size
+        self.__entries = OrderedDict()  # type: OrderedDict[str, Tuple[CacheEntry, bytes]]
+        # Guards `__entries`, which is shared by every thread using the adapter. It is never held while calling into the
+        # decorated cache.
+        self.__lock = threading.Lock()
+
+    def get(self, request: Request) -> Optional[CacheEntry]:
+        with self.__lock:
+            held = self.__entries.get(request.uri)
+            if held is not None:
+                self.__entries.move_to_end(request.uri)
+        if held is not None:
+            logger.info('Found a matching cache entry in memory.')
+            entry, body = held
+            return self._with_body(entry, body)
+
+        logger.info('Delegating cache lookup to decorated cache.')
+        entry = self.__impl.get(request)
+        if entry is None:
+            return None
+
+        size = self._remaining_size(entry.response.body)
+        if size is None or size > self.__max_body_size:
+            logger.info('Not holding the cache entry in memory as its body is too large or of unknown size.')
+            return entry
+
+        with entry.response.body:
+            body = entry.response.body.read()
+        with self.__lock:
+            self.__entries[request.uri] = (entry, body)
+            if len(self.__entries) > self.__max_entries:
+                self.__entries.popitem(last=False)
+        return self._with_body(entry, body)
+
+    def add(self, request: Request, response: Response) -> Optional[CacheEntry]:
+        self._forget(request.uri)
+        return self.__impl.add(request, response)
+
+    def delete(self, request: Request) -> None:
+        self._forget(request.uri)
+        self.__impl.delete(request)
+
+    def replace(self, request: Request, response: Response) -> Optional[CacheEntry]:
+        self._forget(request.uri)
+        return self.__impl.replace(request, response)
+
+    def touch(self, request: Request) -> None:
+        # Simply forget the entry; the next lookup will pick up the new time from the decorated cache.
+        self._forget(request.uri)
+        self.__impl.touch(request)
+
+    def close(self):
+        with self.__lock:
+            self.__entries.clear()
+        self.__impl.close()
+
+    def _forget(self, uri: str) -> None:
+        with self.__lock:
+            self.__entries.pop(uri, None)
+
+    def _with_body(self, entry: CacheEntry, body: bytes) -> CacheEntry:
+        response = copy(entry.response)
+        response.body = BytesIO(body)
+        return CacheEntry(entry.request, response, entry.fetched_at)
+
+    def _remaining_size(self, body: io.IO[bytes]) -> Optional[int]:
+        if not body.seekable():
+            return None
+        position = body.tell()
+        end = body.seek(0, os.SEEK_END)
+        body.seek(position)
+        return end - position
 
 
 @dataclass
@@ -158,30 +359,46 @@ class FileCacheResponseModel:
     status: int
     reason: str
     headers: Mapping[str, str]
-    body_path: Path
 
 
 @dataclass
 class FileCacheEntryModel:
-    entry_path: Path
+    entry_path: str
+    fetched_at: float
     request: Request
     response: FileCacheResponseModel
 
 
 class CorruptEntry(Exception):
-    def __init__(self, entry_path: Path):
+    def __init__(self, entry_path: str):
         super().__init__()
         self.__entry_path = entry_path
 
     @property
-    def entry_path(self) -> Path:
+    def entry_path(self) -> str:
         return self.__entry_path
 
 
+_FORMAT_VERSION = 1
+_PREFIX = struct.Struct('>BI')
+
+
 class FileCache(Cache):
+    """
+    A cache that stores each entry in a single file.
+
+    An entry file consists of a one-byte format version and the length of the entry's metadata as a 4-byte big-endian
+    integer, followed by the metadata itself as JSON, followed by the response body. Keeping the body in the same file
+    as the metadata means a lookup needs to open only one file, and an entry can be added or deleted as a single rename
+    or unlink.
+
+    Entries in any other format version are treated as corrupt, so they are simply replaced when the format changes.
+    """
+
     # TODO Implement proper file locking, etc.
 
-    def __init__(self, directory: Path, cache_directory_levels: int) -> None:
+    def __init__(self, directory: Path, cache_directory_levels: int, index_entries: bool = False,
+                 background_writes: bool = False) -> None:
         """
         Initialize the file cache.
 
@@ -190,24 +407,72 @@ class FileCache(Cache):
         @param cache_directory_levels
           The number of subdirectory levels to use in the cache directory. This
           will be clamped to be between 0 and 20, respectively.
+        @param index_entries
+          Whether to keep an in-memory index of the entries in the cache. The
+          index is built by scanning the cache directory on first use, and
+          lets lookups of absent entries skip the file system entirely. This
+          must only be enabled if no other process writes to the cache
+          directory, as entries added by others would not be seen.
+        @param background_writes
+          Whether to write entry files and move them into place on
+          background threads, rather than on the thread reading the body.
+          Reading the body is then not slowed down by slow storage. Entries
+          appear in the cache shortly after their body is read, and are
+          guaranteed to have been written once `close()` returns.
         """
         self.__directory = directory
-        self.__entry_directory = directory / 'entries'
-        self.__body_directory = directory / 'bodies'
+        self.__entry_directory = os.path.join(directory, 'entries')
+        self.__temp_directory = os.path.join(directory, 'tmp')
         self.__cache_directory_levels = clamp(cache_directory_levels, 0, 20)
+        self.__index_entries = index_entries
+        self.__index = None  # type: Optional[Set[str]]
+        self.__background_writes = background_writes
+        self.__executor = None  # type: Optional[ThreadPoolExecutor]
+        # Bodies may finish on several threads at once, and they must all share one executor for `close()` to wait on.
+        self.__executor_lock = threading.Lock()
+        self.__known_directories = set()  # type: Set[str]
 
     # TODO Factor out pathing into an injectable strategy that can be
     # separately tested
-    def _get_path(self, uri: str) -> Path:
-        hashed = hashlib.sha256(uri.encode('utf-8')).hexdigest()
-        return self._split_path(hashed)
+    def _get_path(self, uri: str) -> str:
+        return _uri_path(uri, self.__cache_directory_levels)
 
-    def _split_path(self, path: str) -> Path:
-        # TODO Ensure that `path` is at least `self.__cache_directory_levels` long.
-        subdirectories = (list(path[:self.__cache_directory_levels])
-                          + [path[self.__cache_directory_levels:]])
-        subdirectory = Path(*subdirectories)
-        return subdirectory
+    def _is_indexed(self, path: str) -> bool:
+        """
+        Check whether the entry at `path`, relative to the entry directory, might exist.
+        """
+        if not self.__index_entries:
+            return True
+        if self.__index is None:
+            logger.info('Building the index of cache entries.')
+            self.__index = self._scan_entries()
+        return path in self.__index
+
+    def _scan_entries(self) -> Set[str]:
+        # `os.scandir()` gives us file types without a `stat()` per entry, and building the relative paths as we descend
+        # avoids re-deriving them from absolute paths.
+        entries = set()
+        pending = [('', self.__entry_directory)]
+        while pending:
+            prefix, directory = pending.pop()
+            try:
+                with os.scandir(directory) as children:
+                    for child in children:
+                        if child.is_dir(follow_symlinks=False):
+                            pending.append((prefix + child.name + os.sep, child.path))
+                        else:
+                            entries.add(prefix + child.name)
+            except FileNotFoundError:
+                pass
+        return entries
+
+    def _update_index(self, path: str, exists: bool) -> None:
+        if self.__index is None:
+            return
+        if exists:
+            self.__index.add(path)
+        else:
+            self.__index.discard(path)
 
     # Paths to cache items are represented by a hash of the URL. Each cache
     # item file should be able to store several cache items. I think the list
@@ -217,113 +482,236 @@ class FileCache(Cache):
     # JSON, wtih the headers as literal objects, which can be compared for
     # equality with the current set of headers.
 
-    def _load_entry(self, request: Request) -> FileCacheEntryModel:
+    def _open_entry(self, request: Request) -> Tuple[FileCacheEntryModel, io.IO[bytes]]:
         """
-        Read a cache entry from a file.
+        Open a cache entry file and read its metadata.
 
         @param request
             The request for which a matching cache entry is desired. The path to the cache entry will be deduced from
             `request`.
         @return
             A tuple containing:
-            1. The path to the entry file.
-            2. The decoded contents of the file. If the file is corrupt in any way, this will be `None`.
+            1. The decoded metadata of the entry.
+            2. The open entry file, positioned at the start of the response body. The caller must close it.
+        @throws FileNotFoundError
+            If there is no entry file for `request`.
         @throws CorruptEntry
             If the entry file could not be parsed.
         """
-        entry_path = self.__entry_directory / self._get_path(request.uri)
+        path = self._get_path(request.uri)
+        entry_path = os.path.join(self.__entry_directory, path)
+        if not self._is_indexed(path):
+            raise FileNotFoundError(entry_path)
+
+        file = open(entry_path, 'rb', buffering=0)
         try:
-            with open(entry_path, 'r') as f:
-                entry = json.load(f)
-            return FileCacheEntryModel(entry_path=entry_path,
-                                       request=Request(
-                                           method=entry['request']['method'],
-                                           uri=entry['request']['uri'],
-                                           headers=entry['request']['headers']
-                                       ),
-                                       response=FileCacheResponseModel(
-                                           status=entry['response']['status'],
-                                           reason=entry['response']['reason'],
-                                           headers=entry['response']['headers'],
-                                           body_path=self.__body_directory / Path(entry['response']['body'])))
-        except FileNotFoundError as e:
-            raise e
-        except (KeyError, json.JSONDecodeError) as e:
+            # The metadata is small, so read it with as few calls as possible rather than through a buffer. That also
+            # leaves the file positioned exactly at the start of the body.
+            fd = file.fileno()
+            # The entry file is replaced or touched whenever the response is fetched or revalidated.
+            fetched_at = os.fstat(fd).st_mtime
+            prefix = _read_fully(fd, _PREFIX.size)
+            if len(prefix) < _PREFIX.size:
+                raise CorruptEntry(entry_path)
+            version, header_length = _PREFIX.unpack(prefix)
+            if version != _FORMAT_VERSION:
+                raise CorruptEntry(entry_path)
+            header = _read_fully(fd, header_length)
+            if len(header) < header_length:
+                raise CorruptEntry(entry_path)
+
+            entry = json_loads(header)
+            # Header names are case-insensitive, and loading them as such lets `HttpAwareCache` look up Vary headers
+            # directly, however they were spelled.
+            model = FileCacheEntryModel(entry_path=entry_path,
+                                        fetched_at=fetched_at,
+                                        request=Request(
+                                            method=entry['request']['method'],
+                                            uri=entry['request']['uri'],
+                                            headers=CaseInsensitiveDict(entry['request']['headers'])
+                                        ),
+                                        response=FileCacheResponseModel(
+                                            status=entry['response']['status'],
+                                            reason=entry['response']['reason'],
+                                            headers=CaseInsensitiveDict(entry['response']['headers'])))
+            return model, file
+        except (KeyError, TypeError, ValueError) as e:
+            file.close()
             raise CorruptEntry(entry_path)
+        except BaseException:
+            file.close()
+            raise
+
+    def _open_body(self, file: io.IO[bytes]) -> io.IO[bytes]:
+        """
+        Wrap an entry file, positioned at the start of its body, as a response body.
+        """
+        offset = file.tell()
+        if os.fstat(file.fileno()).st_size - offset >= MMAP_THRESHOLD:
+            return MappedBody(file, offset)
+        return FileBody(file, offset)
 
     def get(self, request: Request) -> Optional[CacheEntry]:
         try:
             logger.info('Looking at the file system for a cache entry matching the request.')
-            entry_model = self._load_entry(request)
-            logger.info('Loaded entry file. Returning the cache entry')
-            return CacheEntry(
-                request=entry_model.request,
-                response=Response(
-                    status=entry_model.response.status,
-                    reason=entry_model.response.reason,
-                    headers=entry_model.response.headers,
-                    body=open(entry_model.response.body_path, 'rb')
-                )
-            )
-        # TODO When if entry_model.response.body_path does not exist? We *must* distinguish that from the
-        # FileNotFuondError thrown for a missing entry. If the body does not exist, that should be treated the same as a
-        # CorruptEntry.
+            entry_model, file = self._open_entry(request)
         except CorruptEntry as e:
             logger.warning('Found a corrupt cache entry. Deleting the entry file.')
-            e.entry_path.unlink()
+            os.unlink(e.entry_path)
+            self._update_index(self._get_path(request.uri), exists=False)
             return None
         except FileNotFoundError as e:
             logger.info('No matching cache entry found.')
             return None
 
+        logger.info('Loaded entry file. Returning the cache entry')
+        try:
+            body = self._open_body(file)
+        except BaseException:
+            file.close()
+            raise
+        return CacheEntry(
+            request=entry_model.request,
+            response=Response(
+                status=entry_model.response.status,
+                reason=entry_model.response.reason,
+                headers=entry_model.response.headers,
+                body=body
+            ),
+            fetched_at=entry_model.fetched_at
+        )
+
+    def _ensure_directory(self, directory: str) -> None:
+        """
+        Create `directory` and its parents if they do not exist.
+
+        Directories are remembered once created, so the common case of adding to an existing part of the tree costs no
+        system calls.
+        """
+        if directory in self.__known_directories:
+            return
+        os.makedirs(directory, exist_ok=True)
+        while directory not in self.__known_directories:
+            self.__known_directories.add(directory)
+            parent = os.path.dirname(directory)
+            if parent == directory:
+                break
+            directory = parent
+
+    def _forget_directories(self) -> None:
+        # Someone removed part of the cache directory from under us.
+        logger.warning('A cache directory has gone missing. Recreating directories as needed.')
+        self.__known_directories.clear()
+
+    def _in_background(self, job: Callable[[], None]) -> None:
+        with self.__executor_lock:
+            if self.__executor is None:
+                self.__executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='FileCache')
+            future = self.__executor.submit(job)
+        future.add_done_callback(_log_failure)
+
     def add(self, request: Request, response: Response) -> CacheEntry:
         logger.info('Building path to the entry file.')
-        entry_path = self.__entry_directory / self._get_path(request.uri)
-        if entry_path.exists():
-            logger.warning('Aborting. The entry file already exists: {}'.format(entry_path))
-            raise Exception('I refuse to overwrite a cache entry')
-
-        logger.info('Building randomized path to the body file.')
-        # We use a randomized body path as the entry can point to it anyways.
-        body_path = self.__body_directory / self._split_path(os.urandom(32).hex())
-        if body_path.exists():
-            logger.warning('Aborting. The body file already exists: {}'.format(entry_path))
-            raise Exception('I refuse to overwrite an existing response body')
+        path = self._get_path(request.uri)
+        entry_path = os.path.join(self.__entry_directory, path)
+        return self._write_entry(path, entry_path, request, response, exclusive=True)
+
+    def replace(self, request: Request, response: Response) -> CacheEntry:
+        # Entry files are only ever moved into place once complete, so the old entry remains available until the new
+        # one takes its place.
+        logger.info('Building path to the entry file.')
+        path = self._get_path(request.uri)
+        entry_path = os.path.join(self.__entry_directory, path)
+        return self._write_entry(path, entry_path, request, response, exclusive=False)
 
+    def _write_entry(self, path: str, entry_path: str, request: Request, response: Response,
+                     exclusive: bool) -> CacheEntry:
         serialized = {
             'request': {
                 'method': request.method,
                 'uri': request.uri,
-                'headers': request.headers,
+                'headers': dict(request.headers),
             },
             'response': {
                 'status': response.status,
                 'reason': response.reason,
-                'headers': response.headers,
-                'body': str(body_path.relative_to(self.__body_directory))
+                'headers': dict(response.headers),
             }
         }
+        header = json_dumps(serialized)
 
         logger.info('Tee the response body so we can write to the cache as it is read.')
         # The way we are using `Tee` here means that we will only cache a body that is fully read. This avoids waiting
         # on the full download - say, if the user wants to interrupt the download - while also ensuring we don't write
         # partial state to the cache.
-        temp_body_file = tempfile.NamedTemporaryFile(mode='wb', delete=False)
-        def on_complete():
-            logger.info('Download complete.')
+        # The temporary file lives inside the cache directory so that moving it into place is a rename on the same file
+        # system rather than a copy. Readers therefore see either a complete entry or none at all.
+        # A large buffer lets the many small writes made while tee'ing the body be coalesced into few system calls.
+        open_temp_file = functools.partial(
+            tempfile.NamedTemporaryFile, mode='wb', buffering=WRITE_BUFFER_SIZE, dir=self.__temp_directory, delete=False
+        )
+        self._ensure_directory(self.__temp_directory)
+        try:
+            temp_file = open_temp_file()
+        except FileNotFoundError:
+            self._forget_directories()
+            self._ensure_directory(self.__temp_directory)
+            temp_file = open_temp_file()
+        temp_file.write(_PREFIX.pack(_FORMAT_VERSION, len(header)) + header)
+        writer = ThreadedWriter(temp_file) if self.__background_writes else temp_file
+
+        # When adding, we refuse to overwrite an existing entry. Rather than checking up front, we let the file system
+        # enforce it when the entry is moved into place: unlike `os.replace()`, `os.link()` fails if the target exists.
+        move = _move_exclusive if exclusive else os.replace
+
+        def commit():
+            logger.info('Moving the entry file into its permanent location')
+            self._ensure_directory(os.path.dirname(entry_path))
+            try:
+                move(temp_file.name, entry_path)
+            except FileNotFoundError:
+                self._forget_directories()
+                self._ensure_directory(os.path.dirname(entry_path))
+                move(temp_file.name, entry_path)
+            except FileExistsError:
+                logger.warning('Discarding the new entry. The entry file already exists: %s', entry_path)
+                os.unlink(temp_file.name)
+                return
+            self._update_index(path, exists=True)
+
+        def discard():
+            try:
+                os.unlink(temp_file.name)
+            except FileNotFoundError:
+                pass
 
-            logger.info('Moving temporary body file into permanent location')
-            body_path.parent.mkdir(parents=True, exist_ok=True)
-            shutil.move(Path(temp_body_file.name), body_path)
+        def finish():
+            try:
+                # If the writer was already closed, e.g., by the caller closing the body, this still raises any error
+                # that occurred while writing.
+                writer.close()
+            except BaseException:
+                logger.warning('Failed to write the entry file. Discarding it.')
+                discard()
+                raise
+            commit()
 
-            logger.info('Creating entry file that points to the permanent body file')
-            entry_path.parent.mkdir(parents=True, exist_ok=True)
-            with open(entry_path, 'w') as f:
-                json.dump(serialized, f)
+        def on_complete():
+            logger.info('Download complete.')
+            if self.__background_writes:
+                # Closing waits for the pending writes, so leave that to the background thread too.
+                self._in_background(finish)
+            else:
+                finish()
+
+        def on_abort():
+            logger.info('The body was closed before it was fully read. Discarding the partial entry file.')
+            discard()
         tee = Tee(
             response.body,
-            temp_body_file,
-            on_complete
+            writer,
+            on_complete,
+            on_abort
         )
 
         logger.info('Build a new cache entry using the tee\'d response body')
@@ -331,27 +719,89 @@ class FileCache(Cache):
         response.body = tee
         result = CacheEntry(
             request,
-            response
+            response,
+            fetched_at=time.time()
         )
         return result
 
     def delete(self, request: Request) -> None:
+        path = self._get_path(request.uri)
+        entry_path = os.path.join(self.__entry_directory, path)
+        self._update_index(path, exists=False)
         try:
-            logger.info('Looking at the file system for a cache entry matching the request so that we can delete both the entry and the associated body.')
-            entry_model = self._load_entry(request)
-            logger.info('Found a matching cache entry. Marking both the entry file and the body file for deletion.')
-            paths_to_delete = [entry_model.entry_path, entry_model.response.body_path]
-        except CorruptEntry as e:
-            logger.warning('Found a corrupt cache entry. Marking only the entry file for deletion.')
-            paths_to_delete = [e.entry_path]
-        except FileNotFoundError as e:
-            # TODO Log this.
+            logger.info('Deleting %s', entry_path)
+            os.unlink(entry_path)
+        except FileNotFoundError:
             logger.info('No matching cache entry found. Nothing to delete.')
-            return
+        except Exception:
+            logger.exception('Unexpected error occurred while deleting %s', entry_path)
 
-        for path in paths_to_delete:
-            try:
-                logger.info('Deleting {}'.format(path))
-                path.unlink()
-            except Exception:
-                logger.exception('Unexpected error occurred while deleting {}'.format(path))
+    def touch(self, request: Request) -> None:
+        entry_path = os.path.join(self.__entry_directory, self._get_path(request.uri))
+        try:
+            logger.info('Updating the modification time of %s', entry_path)
+            os.utime(entry_path)
+        except FileNotFoundError:
+            logger.info('No matching cache entry found. Nothing to touch.')
+
+    def close(self):
+        with self.__executor_lock:
+            executor, self.__executor = self.__executor, None
+        if executor is not None:
+            logger.info('Waiting for background writes to finish.')
+            executor.shutdown(wait=True)
+
+
+def _read_fully(fd: int, size: int) -> bytes:
+    """
+    Read `size` bytes from `fd`, or fewer only if the end of the file is reached first.
+    """
+    contents = os.read(fd, size)
+    if len(contents) < size:
+        # Short reads are possible, though unlikely for regular files.
+        chunks = [contents]
+        remaining = size - len(contents)
+        while remaining:
+            chunk = os.read(fd, remaining)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            remaining -= len(chunk)
+        contents = b''.join(chunks)
+    return contents
+
+
+_NO_HARD_LINKS = frozenset((errno.EPERM, errno.ENOTSUP, errno.EOPNOTSUPP, errno.ENOSYS))
+"""
+Error numbers with which `os.link()` fails on file systems that do not support hard links.
+"""
+
+
+def _move_exclusive(source: str, destination: str) -> None:
+    """
+    Move `source` to `destination`, failing if `destination` already exists.
+
+    @param source
+      The path of the file to move.
+    @param destination
+      The path to move the file to. Must be on the same file system as `source`.
+    @throws FileExistsError
+      If `destination` already exists. `source` is left in place.
+    """
+    try:
+        os.link(source, destination)
+    except OSError as e:
+        if e.errno not in _NO_HARD_LINKS:
+            raise
+        # The file system does not support hard links (e.g., FAT or some network shares). Checking first leaves a small
+        # window for another writer to get in, but that is the best we can do there.
+        if os.path.exists(destination):
+            raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), destination)
+        os.replace(source, destination)
+        return
+    os.unlink(source)
+
+
+def _log_failure(future: Future) -> None:
+    if future.exception() is not None:
+        logger.error('Failed to write a cache entry.', exc_info=future.exception())
@@ -31,6 +31,9 @@ class Request:
     headers: Mapping[str, str]
     """
     All the headers being sent with the request.
+
+    This may be any mapping, e.g., the case-insensitive mapping used by `requests`. It is not copied, so it should not
+    be modified while the request is in use.
     """
 
 
@@ -81,3 +84,8 @@ class CacheEntry:
     """
     request: Request
     response: Response
+
+    fetched_at: Optional[float] = field(default=None, compare=False)
+    """
+    When the response was received or last revalidated, in seconds since the epoch, if known.
+    """
@@ -1,31 +1,313 @@
-import dataclasses
-from io import RawIOBase, UnsupportedOperation
+from io import BufferedReader, RawIOBase, UnsupportedOperation
 import json
-from typing import Callable, io, Sequence, Type
+import mmap
+import os
+import queue
+import shutil
+import threading
+from typing import Any, Callable, io, Mapping, Optional, Sequence
+from requests.structures import CaseInsensitiveDict
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-def clamp(value, min, max):
-    return sorted((min, value, max))[1]
+
+def clamp(value, minimum, maximum):
+    if value < minimum:
+        return minimum
+    if value > maximum:
+        return maximum
+    return value
+
+
+def json_dumps(value: Any) -> bytes:
+    """
+    Serialize `value` to UTF-8 encoded JSON, using `orjson` when it is installed.
+    """
+    if orjson is not None:
+        return orjson.dumps(value)
+    # Match orjson's compact output; the files are never read by people.
+    return json.dumps(value, separators=(',', ':')).encode('utf-8')
+
+
+def json_loads(data: bytes) -> Any:
+    """
+    Parse UTF-8 encoded JSON, using `orjson` when it is installed.
+
+    @throws json.JSONDecodeError
+      If `data` is not valid JSON. `orjson.JSONDecodeError` is a subclass, so callers need only handle the stdlib type.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def case_insensitive(headers: Mapping[str, str]) -> CaseInsensitiveDict:
+    """
+    View `headers` as a case-insensitive mapping, as HTTP header names are case-insensitive.
+
+    Headers that are already case-insensitive, as `requests` provides them, are returned as is rather than copied.
+    """
+    if isinstance(headers, CaseInsensitiveDict):
+        return headers
+    return CaseInsensitiveDict(headers)
+
+
+class FileBody(BufferedReader):
+    """
+    A reader for a response body stored in a file.
+
+    This reads like any other buffered file, but can also hand the unread remainder of the body directly to another file
+    descriptor (e.g., a socket) via `sendfile_to()`, without copying it through Python.
+
+    The body may start part way into the file, in which case positions are relative to the start of the body, and
+    nothing before it can be read.
+    """
+
+    def __init__(self, raw: io.IO[bytes], offset: int = 0) -> None:
+        """
+        @param raw
+          The unbuffered file containing the body, positioned at `offset`.
+        @param offset
+          Where the body starts within the file.
+        """
+        super().__init__(raw)
+        self.__offset = offset
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if whence == os.SEEK_CUR:
+            offset += self.tell()
+        elif whence == os.SEEK_END:
+            offset += os.fstat(self.fileno()).st_size - self.__offset
+        return super().seek(self.__offset + max(0, offset)) - self.__offset
+
+    def tell(self) -> int:
+        return super().tell() - self.__offset
+
+    def sendfile_to(self, out_fd: int) -> int:
+        """
+        Write the unread remainder of the body to `out_fd`.
+
+        @param out_fd
+          The file descriptor to write to.
+        @return
+          The number of bytes written.
+        """
+        position = self.tell()
+        sent = _sendfile(out_fd, self.fileno(), self.__offset + position, os.fstat(self.fileno()).st_size)
+        # `sendfile()` does not move our file position, and any buffered data is now stale.
+        self.seek(position + sent)
+        return sent
+
+
+class MappedBody(RawIOBase):
+    """
+    A reader for a response body stored in a file, backed by a memory map of that file.
+
+    This avoids copying the body through a read buffer, and lets the kernel share the pages between every reader of the
+    same body. Like `FileBody`, the unread remainder can be handed to another file descriptor via `sendfile_to()`.
+
+    As with `FileBody`, the body may start part way into the file, and positions are relative to the start of the body.
+
+    The file must not be empty, as empty files cannot be mapped.
+    """
+
+    def __init__(self, file: io.IO[bytes], offset: int = 0) -> None:
+        """
+        @param file
+          The file containing the body.
+        @param offset
+          Where the body starts within the file.
+        """
+        self.__file = file
+        self.__offset = offset
+        self.__map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.__map.seek(offset)
+
+    def sendfile_to(self, out_fd: int) -> int:
+        """
+        Write the unread remainder of the body to `out_fd`.
+
+        @param out_fd
+          The file descriptor to write to.
+        @return
+          The number of bytes written.
+        """
+        offset = self.__map.tell()
+        sent = _sendfile(out_fd, self.__file.fileno(), offset, len(self.__map))
+        self.__map.seek(offset + sent)
+        return sent
+
+    # region IOBase methods
+
+    def close(self) -> None:
+        if not self.closed:
+            self.__map.close()
+            self.__file.close()
+        super().close()
+
+    def fileno(self) -> int:
+        return self.__file.fileno()
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if whence == os.SEEK_CUR:
+            offset += self.tell()
+        elif whence == os.SEEK_END:
+            offset += len(self.__map) - self.__offset
+        self.__map.seek(self.__offset + max(0, offset))
+        return self.tell()
+
+    def tell(self) -> int:
+        return self.__map.tell() - self.__offset
+
+    # endregion
+
+    # region RawIOBase methods
+
+    def read(self, size=-1) -> bytes:
+        return self.__map.read(None if size is None or size < 0 else size)
+
+    def readall(self) -> bytes:
+        return self.__map.read()
+
+    def readinto(self, buffer) -> int:
+        offset = self.__map.tell()
+        with memoryview(buffer) as destination, memoryview(self.__map) as source:
+            chunk = source[offset:offset + len(destination)]
+            destination[:len(chunk)] = chunk
+            size = len(chunk)
+            chunk.release()
+        self.__map.seek(offset + size)
+        return size
+
+    # endregion
+
+
+def _sendfile(out_fd: int, in_fd: int, offset: int, end: int) -> int:
+    """
+    Copy bytes `offset` through `end` of `in_fd` to `out_fd`, without moving the file position of `in_fd`.
+
+    @return
+      The number of bytes written.
+    """
+    if not hasattr(os, 'sendfile'):
+        with open(in_fd, 'rb', closefd=False) as source, open(out_fd, 'wb', closefd=False) as out:
+            source.seek(offset)
+            shutil.copyfileobj(source, out)
+        return end - offset
+
+    start = offset
+    while offset < end:
+        sent = os.sendfile(out_fd, in_fd, offset, end - offset)
+        if not sent:
+            break
+        offset += sent
+    return offset - start
+
+
+class ThreadedWriter(RawIOBase):
+    """
+    A writer that hands its writes to a background thread.
+
+    Writes return as soon as the data is queued, so callers are not held up by slow storage. At most `max_pending`
+    writes are queued at a time; beyond that, writes block until the thread catches up. Closing waits for all queued
+    writes to finish, then closes the underlying writer. Any error raised by the underlying writer is re-raised by every
+    call to `close()`.
+    """
+
+    def __init__(self, writer: io.IO[bytes], max_pending: int = 8) -> None:
+        self.__writer = writer
+        self.__queue = queue.Queue(max_pending)
+        self.__error = None  # type: Optional[BaseException]
+        self.__lock = threading.Lock()
+        self.__thread = threading.Thread(target=self._run, name='ThreadedWriter', daemon=True)
+        self.__thread.start()
+
+    def _run(self) -> None:
+        while True:
+            chunk = self.__queue.get()
+            if chunk is None:
+                return
+            if self.__error is None:
+                try:
+                    self.__writer.write(chunk)
+                except BaseException as e:
+                    # Keep draining the queue so that writers are never blocked forever.
+                    self.__error = e
+
+    def close(self) -> None:
+        with self.__lock:
+            if not self.closed:
+                self.__queue.put(None)
+                self.__thread.join()
+                try:
+                    self.__writer.close()
+                finally:
+                    super().close()
+        # Raise on every close, not just the first, so that whoever closes last still learns the data is incomplete.
+        if self.__error is not None:
+            raise self.__error
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, chunk) -> int:
+        if self.closed:
+            raise ValueError('write to closed file')
+        # The caller may reuse its buffer once we return, so we must take a copy.
+        data = bytes(chunk)
+        self.__queue.put(data)
+        return len(data)
 
 
 class Tee(RawIOBase):
-    def __init__(self, reader: io.IO[bytes], writer: io.IO[bytes], on_complete: Callable[[], None]) -> None:
+    def __init__(self, reader: io.IO[bytes], writer: io.IO[bytes], on_complete: Callable[[], None],
+                 on_abort: Optional[Callable[[], None]] = None) -> None:
+        """
+        @param reader
+          The reader to tee.
+        @param writer
+          Where to write everything read from `reader`.
+        @param on_complete
+          Called once the end of `reader` has been reached.
+        @param on_abort
+          Called if the tee is closed before the end of `reader` is reached, after closing `writer`.
+        """
         self.__reader = reader
         self.__writer = writer
         self.__on_complete = on_complete
+        self.__on_abort = on_abort
+        self.__complete = False
 
     def _write_chunk(self, chunk: bytes) -> bytes:
-        self.__writer.write(chunk)
-        if not chunk:
-            # Indicates EOF was reached in the reader.
+        if chunk:
+            self.__writer.write(chunk)
+        elif not self.__complete:
+            # Indicates EOF was reached in the reader. Readers may well keep reading after that, but we only complete
+            # once.
+            self.__complete = True
             self.__on_complete()
         return chunk
 
     # region IOBase methods
 
     def close(self) -> None:
-        self.__reader.close()
-        self.__writer.close()
+        try:
+            self.__reader.close()
+            self.__writer.close()
+        finally:
+            if not self.__complete:
+                self.__complete = True
+                if self.__on_abort is not None:
+                    self.__on_abort()
 
     @property
     def closed(self) -> bool:
@@ -69,8 +351,11 @@ class Tee(RawIOBase):
         return result
 
     def readinto(self, buffer):
-        # Just because I don't feel like figuring how to tee these.
-        raise UnsupportedOperation()
+        # Lets callers reuse one buffer for the whole body instead of allocating a new `bytes` for every chunk.
+        size = self.__reader.readinto(buffer)
+        with memoryview(buffer) as view, view[:size] as chunk:
+            self._write_chunk(chunk)
+        return size
 
     def write(self):
         raise UnsupportedOperation()
@@ -18,11 +18,13 @@ setup_params = dict(
     install_requires=['requests~=2.20.0', 'dataclasses~=0.6;python_version<"3.7"'],
     extras_require={
         'dev': {
-            'mockito': '~=1.1.1',
             'pytest': '~=5.1.2',
             'pytest-cov': '~=2.7.1',
             'ddt': '~=1.2',
-        }
+        },
+        'speedups': {
+            'orjson': '>=3.0',
+        },
     },
     entry_points={},
     python_requires='>=3.4',
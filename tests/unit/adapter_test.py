@@ -0,0 +1,153 @@
+from ddt import ddt, data, unpack
+from io import BytesIO
+import time
+from typing import Mapping, Optional
+from unittest import TestCase
+from unittest.mock import Mock, patch
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+from cached.adapter import _is_stale, CachedHTTPAdapter
+from cached.cache import Cache
+from cached.model import CacheEntry, Request, Response
+
+
+@ddt
+class TestIsStale(TestCase):
+    @data(
+        # When the response does not specify a freshness lifetime, it is never stale.
+        ({}, 100, 1000000, False),
+        # When max-age has not elapsed, the response is fresh.
+        ({'Cache-Control': 'public, max-age=60'}, 100, 159, False),
+        # When max-age has elapsed, the response is stale.
+        ({'Cache-Control': 'public, max-age=60'}, 100, 160, True),
+        # When no-cache is specified, the response must always be revalidated.
+        ({'cache-control': 'no-cache'}, 100, 100, True),
+        # When max-age is invalid, the response is stale.
+        ({'Cache-Control': 'max-age=soon'}, 100, 100, True),
+        # When Expires has not passed relative to Date, the response is fresh.
+        ({'Date': 'Mon, 07 Oct 2019 12:00:00 GMT', 'Expires': 'Mon, 07 Oct 2019 12:01:00 GMT'}, 100, 159, False),
+        # When Expires has passed relative to Date, the response is stale.
+        ({'Date': 'Mon, 07 Oct 2019 12:00:00 GMT', 'Expires': 'Mon, 07 Oct 2019 12:01:00 GMT'}, 100, 160, True),
+        # When Date and Expires use different spellings of UTC, they can still be compared.
+        ({'Date': 'Mon, 07 Oct 2019 12:00:00 GMT', 'Expires': 'Mon, 07 Oct 2019 12:01:00 -0000'}, 100, 159, False),
+        ({'Date': 'Mon, 07 Oct 2019 12:00:00 GMT', 'Expires': 'Mon, 07 Oct 2019 12:01:00 -0000'}, 100, 160, True),
+        # When there is no Date, Expires is measured from when the response was fetched.
+        ({'Expires': 'Mon, 07 Oct 2019 12:01:00 GMT'}, 1570449600, 1570449659, False),
+        ({'Expires': 'Mon, 07 Oct 2019 12:01:00 GMT'}, 1570449600, 1570449660, True),
+        # When Expires is invalid, the response is stale.
+        ({'Date': 'Mon, 07 Oct 2019 12:00:00 GMT', 'Expires': '0'}, 100, 100, True),
+        # When the fetch time is unknown, the response cannot be stale.
+        ({'Cache-Control': 'max-age=0'}, None, 100, False),
+    )
+    @unpack
+    def test_is_stale(self, headers: Mapping[str, str], fetched_at: Optional[float], now: float, expected: bool):
+        entry = CacheEntry(
+            Request(
+                method='GET',
+                uri='http://google.ca',
+                headers={}
+            ),
+            Response(
+                status=200,
+                reason='OK',
+                headers=headers,
+                body=BytesIO(b'')
+            ),
+            fetched_at=fetched_at
+        )
+
+        self.assertEqual(expected, _is_stale(entry, now))
+
+
+class TestCachedResponse(TestCase):
+    def test_headers_are_not_shared_with_the_cache(self):
+        cache = Mock(spec=Cache)
+        cached_headers = CaseInsensitiveDict({'Cache-Control': 'max-age=60', 'ETag': '"v1"'})
+        cache.get.side_effect = lambda request: CacheEntry(
+            request, Response(status=200, reason='OK', headers=cached_headers, body=BytesIO(b'')), fetched_at=time.time()
+        )
+        sut = CachedHTTPAdapter(cache)
+        request = requests.Request('GET', 'http://google.ca/').prepare()
+
+        result = sut.send(request)
+        result.headers['ETag'] = '"changed"'
+        del result.headers['Cache-Control']
+
+        self.assertEqual({'Cache-Control': 'max-age=60', 'ETag': '"v1"'}, dict(cached_headers))
+        self.assertEqual('"v1"', sut.send(request).headers['ETag'], 'The next cache hit should be unaffected')
+
+
+class TestRevalidation(TestCase):
+    def setUp(self):
+        self.__cache = Mock(spec=Cache)
+        self.__sut = CachedHTTPAdapter(self.__cache)
+        self.__cached_body = BytesIO(b'cached contents')
+        # A response that is stale as soon as it is fetched.
+        self.__cache.get.return_value = CacheEntry(
+            Request(method='GET', uri='http://google.ca/', headers={}),
+            Response(
+                status=200,
+                reason='OK',
+                headers={
+                    'Cache-Control': 'max-age=0',
+                    'ETag': '"v1"',
+                    'Last-Modified': 'Mon, 07 Oct 2019 12:00:00 GMT',
+                },
+                body=self.__cached_body
+            ),
+            fetched_at=100
+        )
+
+        send = patch.object(HTTPAdapter, 'send')
+        self.__send = send.start()
+        self.addCleanup(send.stop)
+
+    def _respond(self, status: int, body) -> None:
+        response = requests.Response()
+        response.status_code = status
+        response.reason = 'OK' if status == 200 else 'Not Modified'
+        response.headers = CaseInsensitiveDict({'ETag': '"v2"'} if status == 200 else {})
+        response.raw = body
+        self.__send.return_value = response
+
+    def _send(self) -> requests.Response:
+        return self.__sut.send(requests.Request('GET', 'http://google.ca/').prepare())
+
+    def test_sends_conditional_request(self):
+        self._respond(304, Mock())
+
+        self._send()
+
+        conditional_request, = self.__send.call_args[0]
+        self.assertEqual('"v1"', conditional_request.headers['If-None-Match'])
+        self.assertEqual('Mon, 07 Oct 2019 12:00:00 GMT', conditional_request.headers['If-Modified-Since'])
+
+    def test_not_modified_reuses_cached_response(self):
+        raw = Mock()
+        raw.read.return_value = b''
+        self._respond(304, raw)
+
+        result = self._send()
+
+        self.assertEqual(200, result.status_code)
+        self.assertIs(self.__cached_body, result.raw)
+        self.__cache.touch.assert_called_once_with(Request(method='GET', uri='http://google.ca/', headers={}))
+        self.__cache.replace.assert_not_called()
+        # The connection must go back to the pool rather than be closed.
+        raw.release_conn.assert_called_once_with()
+        raw.close.assert_not_called()
+
+    def test_modified_replaces_cached_response(self):
+        self._respond(200, BytesIO(b'new contents'))
+        self.__cache.replace.side_effect = lambda request, response: CacheEntry(request, response)
+
+        result = self._send()
+
+        self.assertEqual('"v2"', result.headers['ETag'])
+        self.assertEqual(b'new contents', result.raw.read())
+        self.__cache.replace.assert_called_once()
+        self.__cache.touch.assert_not_called()
+        self.assertTrue(self.__cached_body.closed, 'The stale cached body should be closed')
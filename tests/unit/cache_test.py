@@ -1,21 +1,62 @@
 from ddt import ddt, data, unpack
+import errno
 from io import BytesIO
 import json
-from mockito import when, mock, unstub, verify
+import os
 from pathlib import Path
+import shutil
+import struct
+import tempfile
 from tempfile import TemporaryDirectory
+from types import MappingProxyType
 from typing import Optional
 from unittest import TestCase
+from unittest.mock import call, Mock, patch
 
-from cached.cache import Cache, FileCache, HttpAwareCache
+from cached.cache import Cache, FileCache, HttpAwareCache, MemoryCache
 from cached.model import CacheEntry, Request, Response
 
 
 # TODO Separate unit test for FileCache and HttpAwareCache. Move existing type of test to integration tests.
 
 
+# Requests are not modified by the caches, so tests can share them. The same goes for empty bodies, which read the same
+# however often they are read.
+_PDF_REQUEST = Request(method='GET', uri='http://google.ca', headers=MappingProxyType({'Accept': 'application/pdf'}))
+_EMPTY_BODY = BytesIO(b'')
+
+
+def _entry_file(header: bytes, body: bytes) -> bytes:
+    return struct.pack('>BI', 1, len(header)) + header + body
+
+
+def _failing_after_first_write(open_file):
+    """
+    Wrap `open_file` so that the files it opens fail every write after the first, as if the disk had filled up.
+    """
+    def open_failing_file(*args, **kwargs):
+        file = open_file(*args, **kwargs)
+        write = file.write
+        writes = []
+
+        def failing_write(data):
+            writes.append(data)
+            if len(writes) > 1:
+                raise OSError(errno.ENOSPC, os.strerror(errno.ENOSPC))
+            return write(data)
+        file.write = failing_write
+        return file
+    return open_failing_file
+
+
 @ddt
 class TestFileCache(TestCase):
+    def setUp(self):
+        # Keep the file system work in memory where possible. Each test gets a fresh directory.
+        temp_directory = TemporaryDirectory(dir='/dev/shm' if os.path.isdir('/dev/shm') else None)
+        self.addCleanup(temp_directory.cleanup)
+        self.__directory = Path(temp_directory.name)
+
     # TODO Cover the exceptional overwrite cases.
 
     @data(
@@ -44,7 +85,6 @@ class TestFileCache(TestCase):
                         'Vary': 'Accept',
                         'ETag': 'gibberish',
                     },
-                    'body': str(Path('path', 'to', 'body'))
                 }
             }),
             CacheEntry(
@@ -84,36 +124,29 @@ class TestFileCache(TestCase):
     @unpack
     def test_get(self, request: Request, expected_path: Optional[Path], entry_contents: Optional[str],
                  expected_entry: Optional[CacheEntry]):
-        expected_body_path = Path('path', 'to', 'body')
         expected_body_contents = b'some contents';
 
-        with TemporaryDirectory() as directory:
-            directory = Path(directory)
-
-            expected_body_path = directory / 'bodies' / expected_body_path
-            expected_body_path.parent.mkdir(parents=True, exist_ok=True)
-            with open(expected_body_path, 'wb') as f:
-                f.write(expected_body_contents)
-
-            if expected_path is not None:
-                expected_path = directory / 'entries' / expected_path
-                expected_path.parent.mkdir(parents=True, exist_ok=True)
-                with open(expected_path, 'w') as f:
-                    f.write(entry_contents)
-
-            cache = FileCache(directory, 5)
-            entry = cache.get(request)
-
-            if expected_entry is None:
-                self.assertIs(None, entry)
-            else:
-                self.assertEqual(expected_entry.request, entry.request)
-                self.assertEqual(expected_entry.response.status, entry.response.status)
-                self.assertEqual(expected_entry.response.reason, entry.response.reason)
-                self.assertEqual(expected_entry.response.headers, entry.response.headers)
-                # Need to check file contents, not file descriptors.
-                body_contents = entry.response.body.read()
-                self.assertEqual(expected_body_contents, body_contents)
+        directory = self.__directory
+
+        if expected_path is not None:
+            expected_path = directory / 'entries' / expected_path
+            expected_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(expected_path, 'wb') as f:
+                f.write(_entry_file(entry_contents.encode('utf-8'), expected_body_contents))
+
+        cache = FileCache(directory, 5)
+        entry = cache.get(request)
+
+        if expected_entry is None:
+            self.assertIs(None, entry)
+        else:
+            self.assertEqual(expected_entry.request, entry.request)
+            self.assertEqual(expected_entry.response.status, entry.response.status)
+            self.assertEqual(expected_entry.response.reason, entry.response.reason)
+            self.assertEqual(expected_entry.response.headers, entry.response.headers)
+            # Need to check file contents, not file descriptors.
+            body_contents = entry.response.body.read()
+            self.assertEqual(expected_body_contents, body_contents)
 
     @data(
         (
@@ -152,37 +185,289 @@ class TestFileCache(TestCase):
                         'Vary': 'Accept',
                         'ETag': 'gibberish',
                     },
-                    'body': Path('bodies', '9', '8', 'c', 'e', '0', 'b4f1e97102727131a3807371ff3494db4343c7ca41027ad7271a47af279')
                 }
             }
         )
     )
     @unpack
     def test_add(self, request: Request, response: Response, expected_body_contents: bytes, expected_path, expected_contents: dict):
-        with TemporaryDirectory() as directory:
-            directory = Path(directory)
+        directory = self.__directory
 
-            expected_contents['response']['body'] = str(directory / expected_contents['response']['body'])
-            expected_path = directory / 'entries' / expected_path
+        expected_path = directory / 'entries' / expected_path
 
-            cache = FileCache(directory, 5)
-            cache_entry = cache.add(request, response)
-            # Read the entire body to ensure all tee-ing is done.
-            body_contents = cache_entry.response.body.readall()
+        cache = FileCache(directory, 5)
+        cache_entry = cache.add(request, response)
+        # Read the entire body to ensure all tee-ing is done.
+        body_contents = cache_entry.response.body.readall()
 
-            self.assertTrue(expected_path.exists(), 'The cache should create the file for the cache entry')
-            with open(expected_path, 'r') as f:
-                entry_contents = json.load(f)
+        self.assertTrue(expected_path.exists(), 'The cache should create the file for the cache entry')
+        version, header_length = struct.unpack('>BI', expected_path.read_bytes()[:5])
+        self.assertEqual(1, version)
+        entry_contents = json.loads(expected_path.read_bytes()[5:5 + header_length])
+        self.assertEqual(expected_contents, entry_contents)
+        self.assertEqual(expected_body_contents, expected_path.read_bytes()[5 + header_length:],
+                         'The body should follow the metadata in the entry file')
 
-            # The body path is deliberately not predictable.
-            del expected_contents['response']['body']
-            del entry_contents['response']['body']
-            self.assertEqual(expected_contents, entry_contents)
+        self.assertEqual(expected_body_contents, body_contents)
 
-            self.assertEqual(expected_body_contents, body_contents)
+    def test_add_then_get(self):
+        request = Request(
+            method='GET',
+            uri='http://google.ca',
+            headers={
+                'Accept': 'application/pdf',
+            }
+        )
+        response = Response(
+            status=200,
+            reason='OK',
+            headers={
+                'ETag': 'gibberish',
+            },
+            body=BytesIO(b'some contents')
+        )
+
+        directory = self.__directory
+
+        cache = FileCache(directory, 5)
+        # Read the entire body, but do not close it, so the entry must be complete as soon as EOF is seen.
+        body = cache.add(request, response).response.body
+        body.readall()
+        entry = cache.get(request)
+
+        self.assertEqual(request, entry.request)
+        self.assertEqual(response, entry.response)
+        self.assertEqual('application/pdf', entry.request.headers['accept'], 'Headers should be case-insensitive')
+        self.assertEqual('gibberish', entry.response.headers['etag'], 'Headers should be case-insensitive')
+        with entry.response.body:
+            self.assertEqual(b'some contents', entry.response.body.read())
+
+    def test_add_does_not_overwrite(self):
+        request = Request(method='GET', uri='http://google.ca', headers={})
+
+        directory = self.__directory
+
+        cache = FileCache(directory, 5)
+        cache.add(request, Response(status=200, reason='OK', headers={}, body=BytesIO(b'old'))).response.body.readall()
+        body = cache.add(request, Response(status=200, reason='OK', headers={}, body=BytesIO(b'new'))).response.body
+        # The conflict is only detected once the new entry is complete, and must not disturb the reader.
+        self.assertEqual(b'new', body.readall())
+        entry = cache.get(request)
+
+        with entry.response.body:
+            self.assertEqual(b'old', entry.response.body.read())
+        self.assertEqual([], list((directory / 'tmp').iterdir()), 'The discarded entry should be cleaned up')
 
-    # TODO Test that a `add()` can be followed by a `get()`.
+    @data(b'some contents', bytes(range(256)) * 1024)
+    def test_get_body_positions(self, contents: bytes):
+        request = Request(method='GET', uri='http://google.ca', headers={})
 
+        cache = FileCache(self.__directory, 5)
+        response = Response(status=200, reason='OK', headers={}, body=BytesIO(contents))
+        cache.add(request, response).response.body.readall()
+        entry = cache.get(request)
+
+        # Positions are within the body, not the entry file, so the metadata before the body cannot be read.
+        with entry.response.body as body:
+            self.assertEqual(0, body.tell())
+            self.assertEqual(contents, body.read())
+            self.assertEqual(len(contents), body.tell())
+            self.assertEqual(0, body.seek(0))
+            self.assertEqual(contents, body.read())
+
+    def test_add_then_close_early(self):
+        request = Request(method='GET', uri='http://google.ca', headers={})
+
+        cache = FileCache(self.__directory, 5)
+        response = Response(status=200, reason='OK', headers={}, body=BytesIO(b'some contents'))
+        body = cache.add(request, response).response.body
+        body.read(4)
+        body.close()
+
+        self.assertIs(None, cache.get(request), 'A partially read body should not be cached')
+        self.assertEqual([], list((self.__directory / 'tmp').iterdir()), 'The partial entry file should be cleaned up')
+
+    def test_add_without_hard_links(self):
+        request = Request(method='GET', uri='http://google.ca', headers={})
+        cache = FileCache(self.__directory, 5)
+
+        with patch('os.link', side_effect=OSError(errno.EPERM, 'Operation not permitted')):
+            old = Response(status=200, reason='OK', headers={}, body=BytesIO(b'old'))
+            cache.add(request, old).response.body.readall()
+            new = Response(status=200, reason='OK', headers={}, body=BytesIO(b'new'))
+            self.assertEqual(b'new', cache.add(request, new).response.body.readall())
+        entry = cache.get(request)
+
+        with entry.response.body:
+            self.assertEqual(b'old', entry.response.body.read(), 'The first entry should still win')
+        self.assertEqual([], list((self.__directory / 'tmp').iterdir()), 'The discarded entry should be cleaned up')
+
+    def test_replace(self):
+        request = Request(method='GET', uri='http://google.ca', headers={})
+
+        directory = self.__directory
+
+        cache = FileCache(directory, 5)
+        cache.add(request, Response(status=200, reason='OK', headers={}, body=BytesIO(b'old'))).response.body.readall()
+        body = cache.replace(request, Response(status=200, reason='OK', headers={}, body=BytesIO(b'new'))).response.body
+        body.readall()
+        entry = cache.get(request)
+
+        with entry.response.body:
+            self.assertEqual(b'new', entry.response.body.read())
+
+    def test_add_then_get_large_body(self):
+        request = Request(method='GET', uri='http://google.ca', headers={})
+        contents = bytes(range(256)) * 1024
+
+        directory = self.__directory
+
+        cache = FileCache(directory, 5)
+        body = cache.add(request, Response(status=200, reason='OK', headers={}, body=BytesIO(contents))).response.body
+        body.readall()
+        entry = cache.get(request)
+
+        with entry.response.body:
+            self.assertEqual(contents, entry.response.body.read())
+
+    def test_add_after_directories_removed(self):
+        request = Request(method='GET', uri='http://google.ca', headers={})
+
+        directory = self.__directory
+
+        cache = FileCache(directory, 5)
+        cache.add(request, Response(status=200, reason='OK', headers={}, body=BytesIO(b''))).response.body.readall()
+        cache.delete(request)
+        shutil.rmtree(directory / 'entries')
+        shutil.rmtree(directory / 'tmp')
+
+        body = cache.add(request, Response(status=200, reason='OK', headers={}, body=BytesIO(b'some contents')))
+        body.response.body.readall()
+        entry = cache.get(request)
+
+        with entry.response.body:
+            self.assertEqual(b'some contents', entry.response.body.read())
+
+    @data(
+        # Not an entry file at all.
+        b'{"request": {}}',
+        # An entry file in an unknown format version.
+        struct.pack('>BI', 0, 2) + b'{}',
+    )
+    def test_get_corrupt(self, contents: bytes):
+        request = Request(method='GET', uri='http://google.ca', headers={})
+        entry_path = Path('9', '8', 'c', 'e', '0', 'b4f1e97102727131a3807371ff3494db4343c7ca41027ad7271a47af279')
+
+        directory = self.__directory
+        entry_path = directory / 'entries' / entry_path
+        entry_path.parent.mkdir(parents=True)
+        entry_path.write_bytes(contents)
+
+        cache = FileCache(directory, 5)
+
+        self.assertIs(None, cache.get(request))
+        self.assertFalse(entry_path.exists(), 'A corrupt entry file should be deleted')
+
+    def test_background_writes(self):
+        request = Request(
+            method='GET',
+            uri='http://google.ca',
+            headers={
+                'Accept': 'application/pdf',
+            }
+        )
+
+        directory = self.__directory
+
+        cache = FileCache(directory, 5, background_writes=True)
+        body = cache.add(request, Response(
+            status=200,
+            reason='OK',
+            headers={},
+            body=BytesIO(b'some contents')
+        )).response.body
+        self.assertEqual(b'some contents', body.readall())
+        cache.close()
+
+        entry = FileCache(directory, 5).get(request)
+        with entry.response.body:
+            self.assertEqual(b'some contents', entry.response.body.read())
+
+    @data(True, False)
+    def test_background_write_failure(self, close_body_first: bool):
+        request = Request(method='GET', uri='http://google.ca', headers={})
+        cache = FileCache(self.__directory, 5, background_writes=True)
+        jobs = []
+
+        # Hold back the background job, so the test decides whether it runs before or after the body is closed.
+        with patch.object(FileCache, '_in_background', lambda self, job: jobs.append(job)), \
+                patch('tempfile.NamedTemporaryFile', _failing_after_first_write(tempfile.NamedTemporaryFile)):
+            response = Response(status=200, reason='OK', headers={}, body=BytesIO(b'a' * 20))
+            body = cache.add(request, response).response.body
+            self.assertEqual(b'a' * 20, body.readall(), 'The caller should still get the whole body')
+            if close_body_first:
+                with self.assertRaises(OSError):
+                    body.close()
+            job, = jobs
+            with self.assertRaises(OSError):
+                job()
+
+        self.assertIs(None, cache.get(request), 'An entry that failed to be written should not be cached')
+        self.assertEqual([], list((self.__directory / 'tmp').iterdir()), 'The partial entry file should be cleaned up')
+
+    def test_index_entries(self):
+        request = Request(
+            method='GET',
+            uri='http://google.ca',
+            headers={
+                'Accept': 'application/pdf',
+            }
+        )
+        other_request = Request(method='GET', uri='http://google.com', headers={})
+
+        directory = self.__directory
+
+        # An entry written before the cache is created should be found by the initial scan.
+        body = FileCache(directory, 5).add(request, Response(
+            status=200,
+            reason='OK',
+            headers={},
+            body=BytesIO(b'some contents')
+        )).response.body
+        body.readall()
+
+        cache = FileCache(directory, 5, index_entries=True)
+        self.assertIsNot(None, cache.get(request))
+        self.assertIs(None, cache.get(other_request))
+
+        # Entries added afterwards should be indexed as they are written.
+        body = cache.add(other_request, Response(
+            status=200,
+            reason='OK',
+            headers={},
+            body=BytesIO(b'other contents')
+        )).response.body
+        body.readall()
+        self.assertIsNot(None, cache.get(other_request))
+
+        cache.delete(request)
+        self.assertIs(None, cache.get(request))
+
+    def test_touch(self):
+        request = Request(method='GET', uri='http://google.ca', headers={})
+        entry_path = self.__directory / 'entries' / Path(
+            '9', '8', 'c', 'e', '0', 'b4f1e97102727131a3807371ff3494db4343c7ca41027ad7271a47af279')
+
+        cache = FileCache(self.__directory, 5)
+        response = Response(status=200, reason='OK', headers={}, body=BytesIO(b'some contents'))
+        cache.add(request, response).response.body.readall()
+        os.utime(entry_path, (100, 100))
+        cache.touch(request)
+        entry = cache.get(request)
+
+        with entry.response.body:
+            self.assertEqual(b'some contents', entry.response.body.read())
+        self.assertGreater(entry.fetched_at, 100, 'Touching an entry should reset its fetched_at time')
 
     def test_delete(self):
         request = Request(
@@ -195,48 +480,32 @@ class TestFileCache(TestCase):
         )
         expected_path = Path('9', '8', 'c', 'e', '0', 'b4f1e97102727131a3807371ff3494db4343c7ca41027ad7271a47af279')
 
-        with TemporaryDirectory() as directory:
-            directory = Path(directory)
-            expected_path = directory / expected_path
+        directory = self.__directory
+        expected_path = directory / expected_path
 
-            cache = FileCache(directory, 5)
-            cache.delete(request)
+        cache = FileCache(directory, 5)
+        cache.delete(request)
 
 
 @ddt
 class TestHttpAwareCache(TestCase):
     def setUp(self):
-        self.__wrapped = mock(Cache)
+        self.__wrapped = Mock(spec=Cache)
         self.__sut = HttpAwareCache(self.__wrapped)
 
-    def tearDown(self):
-        unstub()
-
     # TODO Invalid cache entries should be deleted.
 
     @data(
         (
             # When the decorated cache does not have an element, neither does the HTTP-aware cache.
-            Request(
-                method='GET',
-                uri='http://google.ca',
-                headers={
-                    'Accept': 'application/pdf',
-                }
-            ),
+            _PDF_REQUEST,
             None,
             None,
         ),
 
         (
             # When the cached entry is for a POST request, it does not qualify for caching by HTTP rules.
-            Request(
-                method='GET',
-                uri='http://google.ca',
-                headers={
-                    'Accept': 'application/pdf',
-                }
-            ),
+            _PDF_REQUEST,
             CacheEntry(
                 Request(
                     method='POST',
@@ -249,7 +518,7 @@ class TestHttpAwareCache(TestCase):
                     status=200,
                     reason='OK',
                     headers={},
-                    body = BytesIO(b'')
+                    body=_EMPTY_BODY
                 )
             ),
             None,
@@ -257,38 +526,68 @@ class TestHttpAwareCache(TestCase):
 
         (
             # When the cached entry is a 5xx error, it does not qualify for caching by HTTP rules.
-            Request(
-                method='GET',
-                uri='http://google.ca',
-                headers={
-                    'Accept': 'application/pdf',
-                }
+            _PDF_REQUEST,
+            CacheEntry(
+                _PDF_REQUEST,
+                Response(
+                    status=500,
+                    reason='Internal Server Error',
+                    headers={},
+                    body=_EMPTY_BODY
+                )
             ),
+            None,
+        ),
+
+        (
+            # When the cached request is missing a Vary header specified in the cached response, the cache entry is invalid
+            _PDF_REQUEST,
+            CacheEntry(
+                _PDF_REQUEST,
+                Response(
+                    status=200,
+                    reason='OK',
+                    headers={
+                        'Vary': 'X-MY-COOL-HEADER'
+                    },
+                    body=_EMPTY_BODY
+                )
+            ),
+            None,
+        ),
+
+        (
+            # When the new request is missing a Vary header specified in the cached response, the cache entry is not matched
+            _PDF_REQUEST,
             CacheEntry(
                 Request(
                     method='GET',
                     uri='http://google.ca',
                     headers={
                         'Accept': 'application/pdf',
+                        'X-MY-COOL-HEADER': 52,
                     }
                 ),
                 Response(
-                    status=500,
-                    reason='Internal Server Error',
-                    headers={},
-                    body = BytesIO(b'')
+                    status=200,
+                    reason='OK',
+                    headers={
+                        'Vary': 'X-MY-COOL-HEADER'
+                    },
+                    body=_EMPTY_BODY
                 )
             ),
             None,
         ),
 
         (
-            # When the cached request is missing a Vary header specified in the cached response, the cache entry is invalid
+            # When the new request has a different value than the cached request for a Vary header, the cache entry is not matched
             Request(
                 method='GET',
                 uri='http://google.ca',
                 headers={
                     'Accept': 'application/pdf',
+                    'X-MY-COOL-HEADER': 53,
                 }
             ),
             CacheEntry(
@@ -297,6 +596,7 @@ class TestHttpAwareCache(TestCase):
                     uri='http://google.ca',
                     headers={
                         'Accept': 'application/pdf',
+                        'X-MY-COOL-HEADER': 52,
                     }
                 ),
                 Response(
@@ -305,19 +605,20 @@ class TestHttpAwareCache(TestCase):
                     headers={
                         'Vary': 'X-MY-COOL-HEADER'
                     },
-                    body = BytesIO(b'')
+                    body=_EMPTY_BODY
                 )
             ),
             None,
         ),
 
         (
-            # When the new request is missing a Vary header specified in the cached response, the cache entry is not matched
+            # When the new request has matches the Vary headers of the cached request, and the status code is 200, then the cached entry is returned.
             Request(
                 method='GET',
                 uri='http://google.ca',
                 headers={
                     'Accept': 'application/pdf',
+                    'X-MY-COOL-HEADER': 52,
                 }
             ),
             CacheEntry(
@@ -335,20 +636,37 @@ class TestHttpAwareCache(TestCase):
                     headers={
                         'Vary': 'X-MY-COOL-HEADER'
                     },
-                    body = BytesIO(b'')
+                    body=_EMPTY_BODY
+                )
+            ),
+            CacheEntry(
+                Request(
+                    method='GET',
+                    uri='http://google.ca',
+                    headers={
+                        'Accept': 'application/pdf',
+                        'X-MY-COOL-HEADER': 52,
+                    }
+                ),
+                Response(
+                    status=200,
+                    reason='OK',
+                    headers={
+                        'Vary': 'X-MY-COOL-HEADER'
+                    },
+                    body=_EMPTY_BODY
                 )
             ),
-            None,
         ),
 
         (
-            # When the new request has a different value than the cached request for a Vary header, the cache entry is not matched
+            # When the new request has matches the Vary headers of the cached request, and the status code is 203, then the cached entry is returned.
             Request(
                 method='GET',
                 uri='http://google.ca',
                 headers={
                     'Accept': 'application/pdf',
-                    'X-MY-COOL-HEADER': 53,
+                    'X-MY-COOL-HEADER': 52,
                 }
             ),
             CacheEntry(
@@ -361,19 +679,36 @@ class TestHttpAwareCache(TestCase):
                     }
                 ),
                 Response(
-                    status=200,
+                    status=203,
                     reason='OK',
                     headers={
                         'Vary': 'X-MY-COOL-HEADER'
                     },
-                    body = BytesIO(b'')
+                    body=_EMPTY_BODY
+                )
+            ),
+            CacheEntry(
+                Request(
+                    method='GET',
+                    uri='http://google.ca',
+                    headers={
+                        'Accept': 'application/pdf',
+                        'X-MY-COOL-HEADER': 52,
+                    }
+                ),
+                Response(
+                    status=203,
+                    reason='OK',
+                    headers={
+                        'Vary': 'X-MY-COOL-HEADER'
+                    },
+                    body=_EMPTY_BODY
                 )
             ),
-            None,
         ),
 
         (
-            # When the new request has matches the Vary headers of the cached request, and the status code is 200, then the cached entry is returned.
+            # When the new request has matches the Vary headers of the cached request, and the status code is 300, then the cached entry is returned.
             Request(
                 method='GET',
                 uri='http://google.ca',
@@ -392,12 +727,12 @@ class TestHttpAwareCache(TestCase):
                     }
                 ),
                 Response(
-                    status=200,
+                    status=300,
                     reason='OK',
                     headers={
                         'Vary': 'X-MY-COOL-HEADER'
                     },
-                    body = BytesIO(b'')
+                    body=_EMPTY_BODY
                 )
             ),
             CacheEntry(
@@ -410,18 +745,18 @@ class TestHttpAwareCache(TestCase):
                     }
                 ),
                 Response(
-                    status=200,
+                    status=300,
                     reason='OK',
                     headers={
                         'Vary': 'X-MY-COOL-HEADER'
                     },
-                    body = BytesIO(b'')
+                    body=_EMPTY_BODY
                 )
             ),
         ),
 
         (
-            # When the new request has matches the Vary headers of the cached request, and the status code is 203, then the cached entry is returned.
+            # When the new request has matches the Vary headers of the cached request, and the status code is 301, then the cached entry is returned.
             Request(
                 method='GET',
                 uri='http://google.ca',
@@ -440,12 +775,12 @@ class TestHttpAwareCache(TestCase):
                     }
                 ),
                 Response(
-                    status=203,
+                    status=301,
                     reason='OK',
                     headers={
                         'Vary': 'X-MY-COOL-HEADER'
                     },
-                    body = BytesIO(b'')
+                    body=_EMPTY_BODY
                 )
             ),
             CacheEntry(
@@ -458,18 +793,41 @@ class TestHttpAwareCache(TestCase):
                     }
                 ),
                 Response(
-                    status=203,
+                    status=301,
                     reason='OK',
                     headers={
                         'Vary': 'X-MY-COOL-HEADER'
                     },
-                    body = BytesIO(b'')
+                    body=_EMPTY_BODY
                 )
             ),
         ),
 
         (
-            # When the new request has matches the Vary headers of the cached request, and the status code is 300, then the cached entry is returned.
+            # When the cached response has no Vary header, the cached entry is returned.
+            _PDF_REQUEST,
+            CacheEntry(
+                _PDF_REQUEST,
+                Response(
+                    status=200,
+                    reason='OK',
+                    headers={},
+                    body=_EMPTY_BODY
+                )
+            ),
+            CacheEntry(
+                _PDF_REQUEST,
+                Response(
+                    status=200,
+                    reason='OK',
+                    headers={},
+                    body=_EMPTY_BODY
+                )
+            ),
+        ),
+
+        (
+            # When the Vary header lists several headers with surrounding whitespace, each is matched.
             Request(
                 method='GET',
                 uri='http://google.ca',
@@ -488,12 +846,12 @@ class TestHttpAwareCache(TestCase):
                     }
                 ),
                 Response(
-                    status=300,
+                    status=200,
                     reason='OK',
                     headers={
-                        'Vary': 'X-MY-COOL-HEADER'
+                        'Vary': 'Accept , X-MY-COOL-HEADER'
                     },
-                    body = BytesIO(b'')
+                    body=_EMPTY_BODY
                 )
             ),
             CacheEntry(
@@ -506,24 +864,24 @@ class TestHttpAwareCache(TestCase):
                     }
                 ),
                 Response(
-                    status=300,
+                    status=200,
                     reason='OK',
                     headers={
-                        'Vary': 'X-MY-COOL-HEADER'
+                        'Vary': 'Accept , X-MY-COOL-HEADER'
                     },
-                    body = BytesIO(b'')
+                    body=_EMPTY_BODY
                 )
             ),
         ),
 
         (
-            # When the new request has matches the Vary headers of the cached request, and the status code is 301, then the cached entry is returned.
+            # Header names are case-insensitive, whether in the Vary header or in the requests.
             Request(
                 method='GET',
                 uri='http://google.ca',
                 headers={
-                    'Accept': 'application/pdf',
-                    'X-MY-COOL-HEADER': 52,
+                    'accept': 'application/pdf',
+                    'x-my-cool-header': 52,
                 }
             ),
             CacheEntry(
@@ -536,12 +894,12 @@ class TestHttpAwareCache(TestCase):
                     }
                 ),
                 Response(
-                    status=301,
+                    status=200,
                     reason='OK',
                     headers={
-                        'Vary': 'X-MY-COOL-HEADER'
+                        'Vary': 'ACCEPT, X-My-Cool-Header'
                     },
-                    body = BytesIO(b'')
+                    body=_EMPTY_BODY
                 )
             ),
             CacheEntry(
@@ -554,12 +912,12 @@ class TestHttpAwareCache(TestCase):
                     }
                 ),
                 Response(
-                    status=301,
+                    status=200,
                     reason='OK',
                     headers={
-                        'Vary': 'X-MY-COOL-HEADER'
+                        'Vary': 'ACCEPT, X-My-Cool-Header'
                     },
-                    body = BytesIO(b'')
+                    body=_EMPTY_BODY
                 )
             ),
         ),
@@ -574,7 +932,7 @@ class TestHttpAwareCache(TestCase):
                  decorated_result: Optional[CacheEntry],
                  expected_entry: Optional[CacheEntry]):
         # region Set up
-        when(self.__wrapped).get(request).thenReturn(decorated_result)
+        self.__wrapped.get.return_value = decorated_result
         # endregion
 
         # region Exercise
@@ -582,6 +940,7 @@ class TestHttpAwareCache(TestCase):
         # endregion
 
         # region Verify
+        self.__wrapped.get.assert_called_once_with(request)
         self.assertEqual(expected_entry, entry)
 
         if expected_entry is not None:
@@ -682,13 +1041,16 @@ class TestHttpAwareCache(TestCase):
     @unpack
     def test_add(self, request: Request, response: Response, expected_entry: Optional[CacheEntry], expected_to_be_cached: bool):
         # region set up
-        when(self.__wrapped).add(request, response).thenReturn(CacheEntry(request, response))
+        self.__wrapped.add.return_value = CacheEntry(request, response)
         # endregion
 
         result = self.__sut.add(request, response)
 
         self.assertEqual(expected_entry, result)
-        verify(self.__wrapped, 1 if expected_to_be_cached else 0).add(request, response)
+        if expected_to_be_cached:
+            self.__wrapped.add.assert_called_once_with(request, response)
+        else:
+            self.__wrapped.add.assert_not_called()
 
     def test_delete(self):
         # region set up
@@ -700,9 +1062,74 @@ class TestHttpAwareCache(TestCase):
                 'X-something-else': 'some value',
             }
         )
-        when(self.__wrapped).delete(request).thenReturn(None)
+        self.__wrapped.delete.return_value = None
         # endregion
 
         self.__sut.delete(request)
 
-        verify(self.__wrapped).delete(request)
+        self.__wrapped.delete.assert_called_once_with(request)
+
+
+class TestMemoryCache(TestCase):
+    def setUp(self):
+        self.__wrapped = Mock(spec=Cache)
+        self.__sut = MemoryCache(self.__wrapped, max_entries=1, max_body_size=16)
+        self.__request = Request(
+            method='GET',
+            uri='http://google.ca',
+            headers={
+                'Accept': 'application/pdf',
+            }
+        )
+
+    def _entry(self, body: bytes) -> CacheEntry:
+        return CacheEntry(
+            self.__request,
+            Response(
+                status=200,
+                reason='OK',
+                headers={},
+                body=BytesIO(body)
+            )
+        )
+
+    def test_get_holds_small_entries(self):
+        self.__wrapped.get.side_effect = lambda request: self._entry(b'some contents')
+
+        first = self.__sut.get(self.__request)
+        second = self.__sut.get(self.__request)
+
+        self.assertEqual(b'some contents', first.response.body.read())
+        self.assertEqual(b'some contents', second.response.body.read())
+        self.__wrapped.get.assert_called_once_with(self.__request)
+
+    def test_get_passes_through_large_entries(self):
+        self.__wrapped.get.side_effect = lambda request: self._entry(b'some larger contents')
+
+        self.__sut.get(self.__request)
+        entry = self.__sut.get(self.__request)
+
+        self.assertEqual(b'some larger contents', entry.response.body.read())
+        self.assertEqual([call(self.__request)] * 2, self.__wrapped.get.call_args_list)
+
+    def test_get_evicts_least_recently_used(self):
+        other_request = Request(method='GET', uri='http://google.com', headers={})
+        self.__wrapped.get.side_effect = \
+            lambda request: self._entry(b'other contents' if request == other_request else b'some contents')
+
+        self.__sut.get(self.__request)
+        self.__sut.get(other_request)
+        self.__sut.get(self.__request)
+
+        self.assertEqual(2, self.__wrapped.get.call_args_list.count(call(self.__request)))
+
+    def test_delete_evicts(self):
+        self.__wrapped.get.side_effect = lambda request: self._entry(b'some contents')
+        self.__wrapped.delete.return_value = None
+
+        self.__sut.get(self.__request)
+        self.__sut.delete(self.__request)
+        self.__sut.get(self.__request)
+
+        self.__wrapped.delete.assert_called_once_with(self.__request)
+        self.assertEqual([call(self.__request)] * 2, self.__wrapped.get.call_args_list)
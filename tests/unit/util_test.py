@@ -1,7 +1,14 @@
 from ddt import ddt, data, unpack
+from io import BytesIO
+import json
+import os
+from pathlib import Path
+from tempfile import TemporaryDirectory
 from unittest import TestCase
+from unittest.mock import patch
 
 from cached import util
+from cached.util import FileBody, MappedBody, Tee, ThreadedWriter
 
 
 @ddt
@@ -22,3 +29,160 @@ class TestClamp(TestCase):
     def test_clamp(self, value, min, max, expected):
         actual = util.clamp(value, min, max)
         self.assertEqual(expected, actual, 'The value should be clamped properly')
+
+
+@ddt
+class TestJson(TestCase):
+    @data(True, False)
+    def test_round_trip(self, use_orjson):
+        value = {'request': {'method': 'GET', 'headers': {'Accept': 'application/pdf'}}, 'status': 200}
+        with patch.object(util, 'orjson', util.orjson if use_orjson else None):
+            actual = util.json_loads(util.json_dumps(value))
+        self.assertEqual(value, actual, 'The value should survive serialization')
+
+    @data(True, False)
+    def test_loads_invalid(self, use_orjson):
+        with patch.object(util, 'orjson', util.orjson if use_orjson else None):
+            with self.assertRaises(json.JSONDecodeError):
+                util.json_loads(b'{"request": ')
+
+
+class TestFileBody(TestCase):
+    def test_sendfile_to(self):
+        with TemporaryDirectory() as directory:
+            directory = Path(directory)
+            (directory / 'body').write_bytes(b'some contents')
+
+            with FileBody(open(directory / 'body', 'rb', buffering=0)) as body, open(directory / 'out', 'wb') as out:
+                self.assertEqual(b'some ', body.read(5))
+                sent = body.sendfile_to(out.fileno())
+                self.assertEqual(b'', body.read(), 'The body should be fully consumed')
+
+            self.assertEqual(8, sent)
+            self.assertEqual(b'contents', (directory / 'out').read_bytes(), 'Only the unread remainder should be sent')
+
+    def test_offset(self):
+        with TemporaryDirectory() as directory:
+            directory = Path(directory)
+            (directory / 'body').write_bytes(b'headersome contents')
+
+            raw = open(directory / 'body', 'rb', buffering=0)
+            raw.seek(6)
+            with FileBody(raw, 6) as body, open(directory / 'out', 'wb') as out:
+                self.assertEqual(0, body.tell())
+                self.assertEqual(b'some contents', body.read())
+                self.assertEqual(0, body.seek(-100, os.SEEK_CUR), 'Seeking should not go before the body')
+                self.assertEqual(5, body.seek(5))
+                self.assertEqual(8, body.sendfile_to(out.fileno()))
+
+            self.assertEqual(b'contents', (directory / 'out').read_bytes())
+
+
+class TestMappedBody(TestCase):
+    def test_read(self):
+        with TemporaryDirectory() as directory:
+            directory = Path(directory)
+            (directory / 'body').write_bytes(b'some contents')
+
+            with MappedBody(open(directory / 'body', 'rb', buffering=0)) as body:
+                buffer = bytearray(4)
+                self.assertEqual(4, body.readinto(buffer))
+                self.assertEqual(b'some', bytes(buffer))
+                self.assertEqual(b' con', body.read(4))
+                self.assertEqual(b'tents', body.read())
+                self.assertEqual(0, body.readinto(buffer), 'There should be nothing left to read')
+
+    def test_sendfile_to(self):
+        with TemporaryDirectory() as directory:
+            directory = Path(directory)
+            (directory / 'body').write_bytes(b'some contents')
+
+            with MappedBody(open(directory / 'body', 'rb', buffering=0)) as body, open(directory / 'out', 'wb') as out:
+                self.assertEqual(b'some ', body.read(5))
+                sent = body.sendfile_to(out.fileno())
+                self.assertEqual(b'', body.read(), 'The body should be fully consumed')
+
+            self.assertEqual(8, sent)
+            self.assertEqual(b'contents', (directory / 'out').read_bytes(), 'Only the unread remainder should be sent')
+
+    def test_offset(self):
+        with TemporaryDirectory() as directory:
+            directory = Path(directory)
+            (directory / 'body').write_bytes(b'headersome contents')
+
+            with MappedBody(open(directory / 'body', 'rb', buffering=0), 6) as body:
+                self.assertEqual(0, body.tell())
+                self.assertEqual(b'some contents', body.read())
+                self.assertEqual(0, body.seek(0))
+                self.assertEqual(b'some', body.read(4))
+                self.assertEqual(0, body.seek(-100, os.SEEK_CUR), 'Seeking should not go before the body')
+                self.assertEqual(5, body.seek(-8, os.SEEK_END))
+                self.assertEqual(b'contents', body.read())
+
+
+class TestTee(TestCase):
+    def test_readinto(self):
+        completions = []
+        writer = BytesIO()
+        tee = Tee(BytesIO(b'some contents'), writer, lambda: completions.append(writer.getvalue()))
+
+        buffer = bytearray(8)
+        chunks = []
+        while True:
+            size = tee.readinto(buffer)
+            chunks.append(bytes(buffer[:size]))
+            if not size:
+                break
+        tee.readinto(buffer)
+
+        self.assertEqual(b'some contents', b''.join(chunks))
+        self.assertEqual([b'some contents'], completions, 'Completion should happen exactly once, after EOF')
+
+    def test_close_before_complete(self):
+        events = []
+        tee = Tee(BytesIO(b'some contents'), BytesIO(),
+                  lambda: events.append('complete'), lambda: events.append('abort'))
+
+        tee.read(4)
+        tee.close()
+        tee.close()
+
+        self.assertEqual(['abort'], events, 'Closing before EOF should abort exactly once')
+
+    def test_close_after_complete(self):
+        events = []
+        tee = Tee(BytesIO(b'some contents'), BytesIO(),
+                  lambda: events.append('complete'), lambda: events.append('abort'))
+
+        tee.readall()
+        tee.close()
+
+        self.assertEqual(['complete'], events, 'Closing after EOF should not abort')
+
+
+class TestThreadedWriter(TestCase):
+    def test_write(self):
+        with TemporaryDirectory() as directory:
+            path = Path(directory, 'file')
+            writer = ThreadedWriter(open(path, 'wb'), max_pending=1)
+
+            # The buffer is reused between writes, as `Tee.readinto` does.
+            buffer = bytearray(4)
+            for chunk in (b'some', b' con', b'tent'):
+                buffer[:] = chunk
+                self.assertEqual(4, writer.write(memoryview(buffer)))
+            writer.close()
+            writer.close()
+
+            self.assertEqual(b'some content', path.read_bytes())
+
+    def test_close_raises_write_error(self):
+        file = BytesIO()
+        file.close()
+        writer = ThreadedWriter(file)
+        writer.write(b'some contents')
+
+        with self.assertRaises(ValueError):
+            writer.close()
+        with self.assertRaises(ValueError, msg='Every close should report the failed write'):
+            writer.close()